@@ -1 +1,2 @@
 from .smps_reader import *
+from .smps_writer import *
@@ -0,0 +1,244 @@
+from .two_stage_utils import scenario_realizations
+import numpy as np
+import heapq
+
+#forward selection evaluates numscen * total * candidates distances,
+#at roughly 1e8 per second. Larger configurations are rejected
+FORWARD_MAX_EVALS = 10**10
+
+def reduce_scenarios(prob_data, numscen, method='backward',
+    max_block=1<<22, candidates=None, rng=None):
+    '''reduce_scenarios takes the output of
+    two_stage_utils.extract_matrix_data and replaces its scenarios
+    by numscen of them with redistributed probabilities. The
+    reduction is done on the realization matrix of the stochastic
+    data (see select_scenarios). prob_data is modified in place.
+    Returns the keys of the selected scenarios and their new
+    probabilities.'''
+    realizations = scenario_realizations(prob_data)
+    inds, probs = select_scenarios(realizations['values'],
+        realizations['probs'], numscen, method=method,
+        max_block=max_block, candidates=candidates, rng=rng)
+    keys = [realizations['scenarios'][i] for i in inds]
+    scenarios = {}
+    for key, prob in zip(keys, probs):
+        scenarios[key] = prob_data['scenarios'][key]
+        scenarios[key]['prob'] = prob
+    prob_data['scenarios'] = scenarios
+    return keys, probs
+
+def select_scenarios(values, probs, numscen, method='backward',
+    max_block=1<<22, candidates=None, rng=None):
+    '''select_scenarios reduces a discrete distribution given by
+    the rows of values (numscen_total x numentries) and their probs
+    to numscen scenarios, using the heuristics of Heitsch and Romisch
+    with euclidean distances between scenarios.
+
+    method is 'backward' for backward reduction or 'forward' for
+    fast forward selection. Backward reduction computes the distances
+    between all pairs once (about two minutes for 100k scenarios)
+    and is the one to use for large sets. Forward selection costs
+    numscen * total * candidates distance evaluations, i.e. hours
+    for reducing 100k scenarios to a few hundred with all of them
+    as candidates. Such configurations (above FORWARD_MAX_EVALS)
+    raise a ValueError. candidates can be an int, in which case that
+    many candidates are sampled (using rng) at every step, which
+    makes the selection approximate, or an array of the indices that
+    may be selected.
+
+    Distances are computed in blocks of at most max_block entries,
+    so the distance matrix is never held in memory.
+
+    Returns the indices of the selected scenarios and their
+    probabilities, which are the original ones plus those of the
+    deleted scenarios closest to them.'''
+    values = np.asarray(values, dtype=float)
+    values = values.reshape(len(values), -1)
+    probs = np.asarray(probs, dtype=float)
+    assert 0 < numscen, "Must keep at least 1 scenario"
+    if numscen >= len(values):
+        return np.arange(len(values)), probs.copy()
+    if method == 'forward':
+        if candidates is None:
+            num_candidates = len(values)
+        elif np.ndim(candidates) == 0:
+            num_candidates = min(candidates, len(values))
+        else:
+            num_candidates = len(candidates)
+        if numscen*len(values)*num_candidates > FORWARD_MAX_EVALS:
+            raise ValueError("Forward selection of " + str(numscen) +\
+                " out of " + str(len(values)) + " scenarios with " +\
+                str(num_candidates) + " candidates is too expensive. " +\
+                "Use method='backward' or fewer candidates")
+        inds = _forward_selection(values, probs, numscen, max_block,
+            candidates, np.random.default_rng(rng))
+    elif method == 'backward':
+        inds = _backward_reduction(values, probs, numscen, max_block)
+    else:
+        raise ValueError("Unrecognized scenario reduction method " + method)
+    return inds, _redistribute(values, probs, inds, max_block)
+
+def _forward_selection(values, probs, numscen, max_block, candidates, rng):
+    '''fast forward selection. At every step the scenario that
+    minimizes the probability weighted distance of all scenarios
+    to the selected set is added'''
+    sq_norms = (values**2).sum(axis=1)
+    #distance of every scenario to the selected set
+    min_dist = np.full(len(values), np.inf)
+    selected = np.zeros(len(values), dtype=np.bool_)
+    inds = []
+    for _ in range(numscen):
+        if candidates is None:
+            cands = np.flatnonzero(~selected)
+        elif np.ndim(candidates) == 0: #number of candidates to sample
+            cands = np.flatnonzero(~selected)
+            if candidates < len(cands):
+                cands = rng.choice(cands, candidates, replace=False)
+        else:
+            cands = np.asarray(candidates)
+            cands = cands[~selected[cands]]
+        assert len(cands) > 0, "Ran out of candidate scenarios"
+        block = max(1, max_block // len(values))
+        best, best_cost = None, np.inf
+        for k in range(0, len(cands), block):
+            dist = _distances(values, sq_norms, cands[k:k+block])
+            cost = probs @ np.minimum(dist, min_dist[:, None], out=dist)
+            if cost.min() < best_cost:
+                best_cost = cost.min()
+                best = cands[k + np.argmin(cost)]
+        inds.append(best)
+        selected[best] = True
+        min_dist = np.minimum(min_dist,
+            _distances(values, sq_norms, [best])[:, 0])
+    return np.array(inds)
+
+def _backward_reduction(values, probs, numscen, max_block,
+    num_neighbors=16):
+    '''backward reduction. At every step the scenario with the
+    smallest probability times distance to its nearest remaining
+    scenario is deleted, and its probability is moved there.
+    The num_neighbors nearest scenarios of each scenario are kept,
+    so a new nearest one is only searched for when they are all
+    deleted'''
+    sq_norms = (values**2).sum(axis=1)
+    probs = probs.copy()
+    kept = np.ones(len(values), dtype=np.bool_)
+    neighbors, neighbor_dists = _nearest(values, sq_norms,
+        np.arange(len(values)), kept, max_block, k=num_neighbors)
+    pos = np.zeros(len(values), dtype=np.intp) #current nearest in neighbors
+    #the scenarios that (possibly) have each scenario as nearest
+    pointed_by = [[] for _ in range(len(values))]
+    for i, j in enumerate(neighbors[:, 0].tolist()):
+        pointed_by[j].append(i)
+    score = probs*neighbor_dists[:, 0]
+    heap = list(zip(score.tolist(), range(len(values))))
+    heapq.heapify(heap)
+    for _ in range(len(values) - numscen):
+        #entries are stale if the score changed since they were pushed
+        this_score, deleted = heapq.heappop(heap)
+        while not kept[deleted] or this_score != score[deleted]:
+            this_score, deleted = heapq.heappop(heap)
+        kept[deleted] = False
+        target = neighbors[deleted, pos[deleted]]
+        probs[target] += probs[deleted]
+        changed = [target]
+        #scenarios whose nearest was deleted move down their neighbors
+        refresh = []
+        for i in pointed_by[deleted]:
+            if not kept[i] or neighbors[i, pos[i]] != deleted:
+                continue
+            while pos[i] < neighbors.shape[1]\
+              and not kept[neighbors[i, pos[i]]]:
+                pos[i] += 1
+            if pos[i] == neighbors.shape[1]\
+              or neighbor_dists[i, pos[i]] == np.inf:
+                refresh.append(i)
+            else:
+                pointed_by[neighbors[i, pos[i]]].append(i)
+                changed.append(i)
+        pointed_by[deleted] = []
+        if refresh: #search the remaining scenarios for new neighbors
+            refresh = np.array(refresh)
+            new_neighbors, new_dists = _nearest(values, sq_norms,
+                refresh, kept, max_block, k=num_neighbors)
+            #with fewer scenarios left than num_neighbors the rest of
+            #the row points to the scenario itself at infinite
+            #distance, which triggers another refresh when reached
+            k = new_neighbors.shape[1]
+            neighbors[refresh, :k] = new_neighbors
+            neighbor_dists[refresh, :k] = new_dists
+            neighbors[refresh, k:] = refresh[:, None]
+            neighbor_dists[refresh, k:] = np.inf
+            pos[refresh] = 0
+            for i in refresh:
+                pointed_by[neighbors[i, 0]].append(i)
+            changed += list(refresh)
+        for i in changed:
+            score[i] = probs[i]*neighbor_dists[i, pos[i]]
+            heapq.heappush(heap, (score[i], i))
+    return np.flatnonzero(kept)
+
+def _redistribute(values, probs, inds, max_block):
+    '''the probability of each deleted scenario goes to the closest
+    selected scenario'''
+    sq_norms = (values**2).sum(axis=1)
+    targets = np.zeros(len(values), dtype=np.bool_)
+    targets[inds] = True
+    closest, _ = _nearest(values, sq_norms, np.arange(len(values)),
+        targets, max_block, exclude_self=False)
+    closest = closest[:, 0]
+    closest[inds] = inds
+    pos = np.empty(len(values), dtype=np.intp)
+    pos[inds] = np.arange(len(inds))
+    return np.bincount(pos[closest], weights=probs, minlength=len(inds))
+
+def _nearest(values, sq_norms, rows, targets, max_block, k=1,
+    exclude_self=True):
+    '''the k nearest scenarios among the targets (a boolean mask)
+    for each scenario in rows, sorted by distance and computed in
+    blocks of rows. Returns the indices and the distances as
+    len(rows) x k arrays'''
+    target_inds = np.flatnonzero(targets)
+    target_pos = np.cumsum(targets) - 1 #position in target_inds
+    k = min(k, len(target_inds))
+    nearest = np.empty((len(rows), k), dtype=np.intp)
+    nearest_dist = np.empty((len(rows), k))
+    block = max(1, max_block // len(target_inds))
+    for start in range(0, len(rows), block):
+        these = rows[start:start+block]
+        #squared distances have the same order, so the square
+        #root is only taken of the nearest ones
+        dist = _sq_distances(values, sq_norms, target_inds, rows=these)
+        if exclude_self:
+            is_target = targets[these]
+            dist[np.flatnonzero(is_target), target_pos[these[is_target]]] = np.inf
+        if k < len(target_inds):
+            closest = np.argpartition(dist, k-1, axis=1)[:, :k]
+        else:
+            closest = np.broadcast_to(np.arange(k), dist.shape)
+        closest_dist = np.take_along_axis(dist, closest, axis=1)
+        order = np.argsort(closest_dist, axis=1)
+        nearest[start:start+block] = target_inds[
+            np.take_along_axis(closest, order, axis=1)]
+        nearest_dist[start:start+block] = np.sqrt(np.take_along_axis(
+            closest_dist, order, axis=1))
+    return nearest, nearest_dist
+
+def _distances(values, sq_norms, cols, rows=None):
+    '''euclidean distances between the scenarios in rows (all by
+    default) and those in cols, as a len(rows) x len(cols) array'''
+    sq_dist = _sq_distances(values, sq_norms, cols, rows=rows)
+    return np.sqrt(sq_dist, out=sq_dist)
+
+def _sq_distances(values, sq_norms, cols, rows=None):
+    '''squared euclidean distances, see _distances'''
+    cols = np.asarray(cols)
+    if rows is None:
+        X, X_sq = values, sq_norms
+    else:
+        X, X_sq = values[rows], sq_norms[rows]
+    sq_dist = X @ values[cols].T
+    sq_dist *= -2
+    sq_dist += X_sq[:, None]
+    sq_dist += sq_norms[cols][None, :]
+    return np.maximum(sq_dist, 0., out=sq_dist)
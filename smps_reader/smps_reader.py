@@ -2,6 +2,7 @@ from mps_reader import parse_mps_file as parse_core_file
 from mps_reader import get_fields_
 from mps_reader import reset_flags_to_false
 from pathlib import Path
+import numpy as np
 import warnings
 
 def read(path_to_smps_file, core_file=None, time_file=None,
@@ -107,6 +108,14 @@ def parse_stoch_file(path_to_stoch_file, strict=True):
     return_scenarios = False
     return_discrete = False
     return_dict = {}
+    #discrete distributions are keyed by element, the others
+    #are grouped by distribution family
+    distrib = {}
+    continuous = {}
+    #INDEP section of every element, to catch elements
+    #that are given more than one distribution
+    element_sections = {}
+    indep_section = 0
     with open(path_to_stoch_file, 'r') as f:
         for line in f:
             if line[0] != ' ': #this is a section
@@ -122,21 +131,18 @@ def parse_stoch_file(path_to_stoch_file, strict=True):
                     scenarios = {}
                 elif sec_name == "INDEP":
                     rv_type = line.split()[1]
-                    assert rv_type == 'DISCRETE',\
-                        "Only DISCRETE supported at this time"
-                    #assert rv_type in ['DISCRETE', 'UNIFORM'\
-                    #    'NORMAL', 'GAMMA', 'BETA', 'LOGNORM']
+                    assert rv_type in ['DISCRETE', 'UNIFORM',\
+                        'NORMAL', 'GAMMA', 'BETA', 'LOGNORM'],\
+                        "Unsupported distribution " + rv_type
                     if len(line.split()) == 3:
                         modify_type = line.split()[2]
-                        assert modify_type == 'REPLACE',\
-                            "Only REPLACE supported at this time."
-                        #assert modify_type in ['ADD', 'MULTIPLY',\
-                        #    'REPLACE']
+                        assert modify_type in ['ADD', 'MULTIPLY',\
+                            'REPLACE'], "Unsupported modifier " + modify_type
                     else: #default is REPLACE
                         modify_type = 'REPLACE'
                     flags['in_indep'] = True
                     return_discrete = True
-                    distrib = {}
+                    indep_section += 1
                 elif sec_name == "BLOCKS":
                     rv_type = line.split()[1]
                     assert rv_type == 'DISCRETE',\
@@ -188,16 +194,35 @@ def parse_stoch_file(path_to_stoch_file, strict=True):
                 field1, field2, field3, field4, field5, field6 = \
                     get_fields(line)
                 #note. period is in field 5. It's often ''
-                #so I'm ignoring it for now
+                #so I'm ignoring it for now. If it is left out
+                #entirely the probability (or 2nd parameter)
+                #in field 6 ends up in field 5
                 col, row = field2, field3
-                if (col, row) in distrib.keys():
+                field6 = field6 if field6 != '' else field5
+                #only a discrete distribution spans several lines
+                if (col, row) in element_sections.keys() and\
+                  (rv_type != 'DISCRETE' or\
+                  element_sections[(col, row)] != indep_section):
+                    raise ValueError("Element " + str((col, row)) +\
+                        " has more than one distribution")
+                element_sections[(col, row)] = indep_section
+                if rv_type != 'DISCRETE':
+                    if rv_type not in continuous.keys():
+                        continuous[rv_type] = {'elements':[],\
+                            'params':[], 'modify':[]}
+                    continuous[rv_type]['elements'].append((col, row))
+                    continuous[rv_type]['params'].append(\
+                        (float(field4), float(field6)))
+                    continuous[rv_type]['modify'].append(modify_type)
+                elif (col, row) in distrib.keys():
                     distrib[(col, row)]\
                       ['values'].append(float(field4))
                     distrib[(col, row)]\
-                      ['probs'].append(float(field5)) 
+                      ['probs'].append(float(field6)) 
                 else:
                     distrib[(col, row)] =\
-                    {'values':[float(field4),], 'probs':[float(field5),]}
+                    {'values':[float(field4),], 'probs':[float(field6),],
+                     'modify':modify_type}
             elif flags['in_blocks']: #needs tested. I think this is not working
                 field1, field2, field3, field4, field5, field6 = \
                     get_fields(line)
@@ -222,6 +247,13 @@ def parse_stoch_file(path_to_stoch_file, strict=True):
         return_dict['discrete_flag'] = return_discrete
         if return_discrete:
             return_dict['distrib'] = distrib
+            #one array of parameters per family (field 4 and 6
+            #in the columns) for sampling all elements at once
+            for family in continuous.values():
+                family['params'] = np.array(family['params'], dtype=float)\
+                    .reshape(-1, 2)
+                family['modify'] = np.array(family['modify'])
+            return_dict['continuous'] = continuous
         return_dict['prob_name'] = prob_name
         assert return_scenarios or return_discrete, "Neither distribution nor scenario representation"
         return return_dict #returns a dictionary contaning scenarious or discrete distributions on elements.
@@ -0,0 +1,293 @@
+from .two_stage_utils import extract_matrix_data, scenario_realizations
+from pathlib import Path
+import numpy as np
+import scipy.sparse
+
+#format of the numeric field (field 4). Fixed format only
+#has 12 characters for it, free format can write exact values
+VALUE_FMT = {True:'%12.6g', False:'%.17g'}
+#widths of the name fields in fixed format
+NAME_WIDTH = 8
+VALUE_WIDTH = 12
+
+def write(path_to_smps_file, data, numscen=10000, strict=True,
+    chunk_size=4096, rng=None):
+    '''write takes a path and a two stage problem and writes it
+    in smps format, i.e. as a core, time and stochastics (stochs)
+    file with extensions .cor, .tim, and .sto, respectively. The
+    extension of the provided path is replaced, as in read.
+
+    The problem can be given either as the output of
+    two_stage_utils.extract_matrix_data, or as the dictionaries
+    returned by read. In the latter case extract_matrix_data is
+    called first, so INDEP files are sampled into numscen scenarios
+    using rng (see extract_matrix_data).
+
+    The stochastics file always uses an explicit SCENARIOS section.
+    If strict is True the fixed mps fields are used, which limits
+    names to 8 characters and values to 6 significant digits. Longer
+    names (or values that don't fit in 12 characters) raise a
+    ValueError. Otherwise free format is written with exact values.
+
+    chunk_size is passed to write_stoch_file.'''
+
+    base_path = path_to_smps_file.removesuffix('.'.join(Path(path_to_smps_file).suffixes))
+    if 'core' in data: #these are the dictionaries from read
+        prob_data = extract_matrix_data(data, numscen=numscen, rng=rng)
+    else:
+        prob_data = data
+    realizations = scenario_realizations(prob_data)
+    write_core_file(base_path + ".cor", prob_data, strict=strict,
+        stoch_entries=realizations['entries'])
+    write_time_file(base_path + ".tim", prob_data, strict=strict)
+    write_stoch_file(base_path + ".sto", prob_data, strict=strict,
+        chunk_size=chunk_size, realizations=realizations)
+
+def write_core_file(path_to_core_file, prob_data, strict=True,
+    stoch_entries=None):
+    '''writes the deterministic (root) data of prob_data as a core
+    file. stoch_entries is a list of (block, row, column) tuples as
+    returned by two_stage_utils.scenario_realizations. These entries
+    are written even if they are zero in the core, since readers
+    expect every stochastic element to be present in the core file.'''
+    labels = _get_labels(prob_data)
+    _check_names([labels['obj_row']] + labels['stage1cols']\
+        + labels['stage2cols'] + labels['stage1rows']\
+        + labels['stage2rows'], strict)
+    col_labels = np.array(labels['stage1cols'] + labels['stage2cols'], dtype=object)
+    row_labels = np.array([labels['obj_row']] + labels['stage1rows']\
+        + labels['stage2rows'], dtype=object)
+    n1, m1 = len(labels['stage1cols']), len(labels['stage1rows'])
+    n2, m2 = len(labels['stage2cols']), len(labels['stage2rows'])
+
+    #the full constraint matrix with the objective as the first row
+    M = scipy.sparse.bmat([
+        [scipy.sparse.csr_matrix(np.reshape(prob_data['c'], (1, n1))),
+         scipy.sparse.csr_matrix(np.reshape(prob_data['q_root'], (1, n2)))],
+        [scipy.sparse.csr_matrix(prob_data['A'], shape=(m1, n1)),
+         scipy.sparse.csr_matrix((m1, n2))],
+        [scipy.sparse.csr_matrix(prob_data['T_root'], shape=(m2, n1)),
+         scipy.sparse.csr_matrix(prob_data['W_root'], shape=(m2, n2))]],
+        format='coo')
+    M.eliminate_zeros()
+    rhs = np.concatenate([np.ravel(prob_data['b']),
+        np.ravel(prob_data['r_root'])]).astype(float)
+    rhs_inds = [np.flatnonzero(rhs)]
+    #placeholders for stochastic elements and for empty columns
+    #(a column w/o entries would not be declared at all)
+    extra_rows, extra_cols = [], []
+    for block, i, j in (stoch_entries or []):
+        if block == 'q':
+            extra_rows.append(0); extra_cols.append(n1 + i)
+        elif block == 'r':
+            rhs_inds.append([m1 + i])
+        elif block == 'T':
+            extra_rows.append(1 + m1 + i); extra_cols.append(j)
+        elif block == 'W':
+            extra_rows.append(1 + m1 + i); extra_cols.append(n1 + j)
+    empty_cols = np.setdiff1d(np.arange(n1 + n2), M.col)
+    extra_rows += [0]*len(empty_cols)
+    extra_cols += list(empty_cols)
+    M = scipy.sparse.coo_matrix((
+        np.concatenate([M.data, np.zeros(len(extra_rows))]),
+        (np.concatenate([M.row, extra_rows]).astype(np.intp),
+         np.concatenate([M.col, extra_cols]).astype(np.intp))),
+        shape=M.shape).tocsc()
+    M.sum_duplicates() #explicit zeros are kept, which we want
+    cols = np.repeat(np.arange(M.shape[1]), np.diff(M.indptr))
+    rhs_inds = np.unique(np.concatenate(rhs_inds).astype(np.intp))
+
+    ineq = np.concatenate([np.ravel(prob_data['ineq_b']),
+        np.ravel(prob_data['ineq_r'])]).astype(bool)
+    l = np.concatenate([np.ravel(prob_data['l1']), np.ravel(prob_data['l2'])])
+    u = np.concatenate([np.ravel(prob_data['u1']), np.ravel(prob_data['u2'])])
+
+    with open(path_to_core_file, 'w', buffering=1<<20) as f:
+        f.write(_header("NAME", labels['prob_name']))
+        f.write("ROWS\n")
+        f.write(_record('N', labels['obj_row'], strict=strict))
+        f.write(''.join(_record('L' if is_ineq else 'E', row, strict=strict)
+            for row, is_ineq in zip(row_labels[1:], ineq)))
+        f.write("COLUMNS\n")
+        _write_records(f, col_labels[cols], row_labels[M.indices],
+            M.data, strict)
+        f.write("RHS\n")
+        _write_records(f, np.full(len(rhs_inds), 'RHS', dtype=object),
+            row_labels[1 + rhs_inds], rhs[rhs_inds], strict)
+        f.write("BOUNDS\n")
+        #mps defaults are 0 <= x <= inf, so only deviations are written
+        fixed = (l == u)
+        free = (l == -np.inf) & (u == np.inf)
+        bounds = [('FX', fixed), ('FR', free),
+            ('MI', ~fixed & ~free & (l == -np.inf)),
+            ('LO', ~fixed & ~free & ((l != 0) | (u < 0)) & (l != -np.inf)),
+            ('UP', ~fixed & ~free & (u != np.inf))]
+        for bound_type, mask in bounds:
+            inds = np.flatnonzero(mask)
+            vals = u[inds] if bound_type == 'UP' else l[inds]
+            vals = np.where(np.isfinite(vals), vals, 0.)
+            _write_records(f, np.full(len(inds), 'BND', dtype=object),
+                col_labels[inds], vals, strict, field1=bound_type)
+        f.write("ENDATA\n")
+
+def write_time_file(path_to_time_file, prob_data, strict=True):
+    '''writes a time file with implicit periods for prob_data.
+    Rows and columns are ordered by period in write_core_file,
+    so only the first row and column of each period is needed.'''
+    labels = _get_labels(prob_data)
+    period1, period2 = labels['periods']
+    if not labels['stage1cols'] or not labels['stage2cols']\
+      or not labels['stage2rows']:
+        raise ValueError("Implicit periods need columns in both periods "\
+            "and rows in the second period")
+    _check_names(labels['periods'], strict)
+    first_row = labels['stage1rows'][0] if labels['stage1rows']\
+        else labels['obj_row']
+    with open(path_to_time_file, 'w') as f:
+        f.write(_header("TIME", labels['prob_name']))
+        f.write(_header("PERIODS", "IMPLICIT"))
+        #the period goes in field 4, this file is not %-formatted
+        f.write(_record('', labels['stage1cols'][0], first_row,
+            value=period1, strict=strict))
+        f.write(_record('', labels['stage2cols'][0],
+            labels['stage2rows'][0], value=period2, strict=strict))
+        f.write("ENDATA\n")
+
+def write_stoch_file(path_to_stoch_file, prob_data, strict=True,
+    chunk_size=4096, realizations=None):
+    '''writes the scenarios of prob_data as a stochastics file with
+    an explicit SCENARIOS section. Every scenario lists the values
+    of all stochastic elements, i.e. the elements that differ from
+    the root in at least one scenario.
+
+    Records are formatted chunk_size scenarios at a time from a
+    single format template, which avoids formatting fields one by
+    one. realizations can be passed to reuse the output of
+    two_stage_utils.scenario_realizations'''
+    labels = _get_labels(prob_data)
+    if realizations is None:
+        realizations = scenario_realizations(prob_data)
+    #field 2 and 3 of the record that updates each entry
+    stage1cols, stage2cols = labels['stage1cols'], labels['stage2cols']
+    stage2rows = labels['stage2rows']
+    names = []
+    for block, i, j in realizations['entries']:
+        if block == 'q':
+            names.append((stage2cols[i], labels['obj_row']))
+        elif block == 'r':
+            names.append(('RHS', stage2rows[i]))
+        elif block == 'T':
+            names.append((stage1cols[j], stage2rows[i]))
+        elif block == 'W':
+            names.append((stage2cols[j], stage2rows[i]))
+    scen_names = [scen if isinstance(scen, str) else 'S' + str(scen)
+        for scen in realizations['scenarios']]
+    _check_names([name for pair in names for name in pair] + scen_names\
+        + [labels['periods'][1]], strict)
+    #one template formats a whole scenario, its header included
+    template = _record('SC', None, "'ROOT'", labels['periods'][1],
+        value=VALUE_FMT[strict], strict=strict)\
+        + ''.join(_record('', col, row, value=VALUE_FMT[strict],
+            strict=strict) for col, row in names)
+    probs, values = realizations['probs'], realizations['values']
+    _check_values(probs, strict)
+    _check_values(values, strict)
+
+    with open(path_to_stoch_file, 'w', buffering=1<<20) as f:
+        f.write(_header("STOCH", labels['prob_name']))
+        f.write(_header("SCENARIOS", "DISCRETE"))
+        for k in range(0, len(scen_names), chunk_size):
+            f.write(_format_scenarios(template, scen_names[k:k+chunk_size],
+                probs[k:k+chunk_size], values[k:k+chunk_size]))
+        f.write("ENDATA\n")
+
+def _format_scenarios(template, scen_names, probs, values):
+    '''formats a chunk of scenarios with the scenario template'''
+    args = np.empty((len(scen_names), values.shape[1] + 2), dtype=object)
+    args[:, 0] = scen_names
+    args[:, 1] = probs
+    args[:, 2:] = values
+    return (template*len(scen_names)) % tuple(args.ravel().tolist())
+
+def _write_records(f, field2, field3, values, strict, field1=''):
+    '''writes one record per value in chunks of a single
+    format string'''
+    _check_values(values, strict)
+    chunk_size = 1<<16
+    for k in range(0, len(values), chunk_size):
+        template = ''.join(_record(field1, name2, name3,
+            value=VALUE_FMT[strict], strict=strict) for name2, name3 in
+            zip(field2[k:k+chunk_size], field3[k:k+chunk_size]))
+        f.write(template % tuple(np.asarray(values[k:k+chunk_size],
+            dtype=float).tolist()))
+
+def _record(field1, field2, field3='', field5='', value='', strict=True):
+    '''returns a data record as a format string. value is placed
+    in field 4 and should be a format specifier (or ''). If field2
+    is None it is a %s specifier as well'''
+    esc = lambda x: str(x).replace('%', '%%')
+    if strict: #fixed mps fields
+        name2 = ('%-8s' if field2 is None else esc(field2).ljust(8))
+        line = ' ' + esc(field1).ljust(2) + ' ' + name2
+        if field3 != '' or value != '' or field5 != '':
+            line += '  ' + esc(field3).ljust(8)
+        if value != '' or field5 != '':
+            line += '  ' + (value if value else ' '*12)
+        if field5 != '':
+            line += '   ' + esc(field5)
+        return line.rstrip() + '\n'
+    fields = [esc(field1) if field1 else '  ',
+        '%s' if field2 is None else esc(field2)]
+    fields += [field for field in [esc(field3), value, esc(field5)] if field != '']
+    return ' ' + ' '.join(fields) + '\n'
+
+def _check_names(names, strict):
+    '''in fixed format names have to fit in their fields'''
+    if not strict:
+        return
+    for name in names:
+        if len(str(name)) > NAME_WIDTH:
+            raise ValueError("Name " + str(name) + " is longer than "\
+                + str(NAME_WIDTH) + " characters. Use strict=False")
+
+def _check_values(values, strict):
+    '''in fixed format values have to fit in field 4. Only values
+    with a 3 digit exponent can be too long'''
+    if not strict:
+        return
+    values = np.ravel(values)
+    abs_values = np.abs(values)
+    suspects = values[(abs_values >= 1e99)\
+        | ((abs_values < 1e-98) & (abs_values > 0))]
+    for value in suspects.tolist():
+        if len(VALUE_FMT[strict] % value) > VALUE_WIDTH:
+            raise ValueError("Value " + repr(value) + " is longer than "\
+                + str(VALUE_WIDTH) + " characters. Use strict=False")
+
+def _header(section, name):
+    '''section line with the name starting in column 15'''
+    return (section.ljust(14) + str(name)).rstrip() + '\n'
+
+def _get_labels(prob_data):
+    '''labels for rows, columns and periods of prob_data. These
+    are stored by extract_matrix_data. Generic ones are
+    made up if they are missing'''
+    n1, n2 = len(np.ravel(prob_data['c'])), len(np.ravel(prob_data['q_root']))
+    m1, m2 = len(np.ravel(prob_data['b'])), len(np.ravel(prob_data['r_root']))
+    if 'index_dict' in prob_data:
+        index_dict = prob_data['index_dict']
+        #the index dictionaries are built in index order
+        stage1cols = list(index_dict['var2ATind'].keys())
+        stage2cols = list(index_dict['var2Wind'].keys())
+        stage1rows = list(index_dict['row2Aind'].keys())
+        stage2rows = list(index_dict['row2WTind'].keys())
+    else:
+        stage1cols = ['C' + str(j) for j in range(n1)]
+        stage2cols = ['C' + str(j) for j in range(n1, n1 + n2)]
+        stage1rows = ['R' + str(i) for i in range(m1)]
+        stage2rows = ['R' + str(i) for i in range(m1, m1 + m2)]
+    return {'prob_name':prob_data.get('prob_name', ''),
+        'periods':prob_data.get('periods', ['STAGE1', 'STAGE2']),
+        'obj_row':prob_data.get('obj_row', 'OBJ'),
+        'stage1cols':stage1cols, 'stage2cols':stage2cols,
+        'stage1rows':stage1rows, 'stage2rows':stage2rows}
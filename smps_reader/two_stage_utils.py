@@ -2,10 +2,13 @@ import numpy as np
 import scipy.sparse
 import mps_reader
 
-def extract_matrix_data(parsed_file_dicts, numscen=10000):
+def extract_matrix_data(parsed_file_dicts, numscen=10000, rng=None):
     '''construct_vecs_and_mats takes a dictionary from
     smps_reader and returns the matrix data defining 
-    a two stage problem with discrete scenarios'''
+    a two stage problem with discrete scenarios. If the
+    problem gives distributions, numscen scenarios are
+    sampled from them using rng (a numpy Generator or seed,
+    see generate_scenarios_from_distribs)'''
     #extract the dictionaries for each file for further use
     core = parsed_file_dicts['core']
     time = parsed_file_dicts['time']
@@ -122,6 +125,11 @@ def extract_matrix_data(parsed_file_dicts, numscen=10000):
         prob_data = {'A':A, 'b':b, 'c':c, 'l1':l1, 'u1':u1, 'l2':l2, 'u2':u2,\
             'T_root':T, 'W_root':W, 'r_root':r, 'q_root':q, 'ineq_b':ineq_b,\
             'ineq_r':ineq_r, 'scenarios':{}}
+        #keep the labels around so the problem can be written back out
+        prob_data['prob_name'] = core['prob_name']
+        prob_data['periods'] = list(time['periods'].keys())
+        prob_data['obj_row'] = obj_row
+        prob_data['index_dict'] = index_dict
 
         if stoch['scenarios_flag']:
             generate_scenarios_from_scenarios(stoch, prob_data, obj_row,\
@@ -134,8 +142,8 @@ def extract_matrix_data(parsed_file_dicts, numscen=10000):
                 dist['values'] = np.array(dist['values']) 
                 dist['probs'] = np.array(dist['probs'])
 
-            generate_scenarios_from_discrete_distribs(stoch,\
-                prob_data, obj_row, index_dict, core, numscen)
+            generate_scenarios_from_distribs(stoch,\
+                prob_data, obj_row, index_dict, core, numscen, rng=rng)
         else:
             assert False, "Dead End"
     else: #explicit scenarios
@@ -207,53 +215,227 @@ def generate_scenarios_from_scenarios(stoch, prob_data, obj_row, index_dict, cor
                 assert False, "not a recognized update!"
         prob_data['scenarios'][scen] = this_scen
 
-def generate_scenarios_from_discrete_distribs(stoch, prob_data,\
-     obj_row, index_dict, core, numscen):
+#samplers for the continuous INDEP families. p1 and p2 are the
+#parameters in fields 4 and 6, as arrays with one entry per element.
+#NORMAL and LOGNORM give the variance (of the underlying normal),
+#GAMMA gives the scale first and then the shape
+SAMPLERS = {
+    'UNIFORM': lambda rng, p1, p2, size: rng.uniform(p1, p2, size),
+    'NORMAL': lambda rng, p1, p2, size: rng.normal(p1, np.sqrt(p2), size),
+    'GAMMA': lambda rng, p1, p2, size: rng.gamma(p2, p1, size),
+    'BETA': lambda rng, p1, p2, size: rng.beta(p1, p2, size),
+    'LOGNORM': lambda rng, p1, p2, size: rng.lognormal(p1, np.sqrt(p2), size),
+    }
+
+def generate_scenarios_from_distribs(stoch, prob_data,\
+     obj_row, index_dict, core, numscen, rng=None):
+    '''samples numscen equally likely scenarios from the INDEP
+    distributions in stoch, both the discrete ones and the
+    continuous families. Each family is drawn for all of its
+    elements and scenarios with one call to the generator, and the
+    ADD and MULTIPLY modifiers are applied to the core values with
+    array operations. rng is a numpy Generator or a seed. If it
+    is None the global numpy random state is used, so np.random.seed
+    still makes the scenarios reproducible (but the draws differ
+    from those of earlier versions, which sampled element by element)'''
 
     var2ATind, var2Wind, row2Aind, row2WTind=\
         index_dict['var2ATind'], index_dict['var2Wind'],\
         index_dict['row2Aind'], index_dict['row2WTind']
+    #the legacy np.random functions have the same names and
+    #signatures as the Generator methods used here
+    rng = np.random if rng is None else np.random.default_rng(rng)
 
-    for scen in range(numscen):
-        prob_data['scenarios'][scen] = {
-            'prob':1./numscen,
-            'T': prob_data['T_root'].copy(),
-            'W': prob_data['W_root'].copy(),
-            'q': prob_data['q_root'].copy(),
-            'r': prob_data['r_root'].copy()
-            }
-    
-    for nz_ind, (row, col) in enumerate(stoch['distrib'].keys()):
-        #next we generate data for all scenarios for this value
-        data = np.random.choice(stoch['distrib'][(row, col)]['values'],\
-            numscen,\
-            p=stoch['distrib'][(row, col)]['probs'])
-        #next we find what kind of update it is, and then update the mats accordingly
+    elements = []
+    data = []
+    modify = []
+    #discrete elements share one draw of uniforms, which are
+    #inverted through the cumulative probabilities of each element
+    distrib = stoch['distrib']
+    if len(distrib) > 0:
+        unif = rng.random((numscen, len(distrib)))
+        samples = np.empty((numscen, len(distrib)))
+        for k, (element, dist) in enumerate(distrib.items()):
+            cum_probs = np.cumsum(dist['probs'])
+            #same tolerance as np.random.choice
+            assert abs(cum_probs[-1] - 1.) <= np.sqrt(np.finfo(float).eps),\
+                "Probabilities of " + str(element) + " do not sum to 1"
+            inds = np.searchsorted(cum_probs, unif[:, k],\
+                side='right')
+            samples[:, k] = np.asarray(dist['values'])[np.minimum(inds, len(cum_probs)-1)]
+            elements.append(element)
+            modify.append(dist.get('modify', 'REPLACE'))
+        data.append(samples)
+    for rv_type, family in stoch.get('continuous', {}).items():
+        params = family['params']
+        data.append(SAMPLERS[rv_type](rng, params[:, 0], params[:, 1],\
+            (numscen, len(params))))
+        elements += family['elements']
+        modify += list(family['modify'])
+    data = np.hstack(data) if data else np.empty((numscen, 0))
+    modify = np.array(modify, dtype=str)
+
+    #next we find what kind of update each element is, and its
+    #index in the root matrices or vectors
+    blocks = {'q':[], 'r':[], 'W':[], 'T':[]}
+    base = np.empty(len(elements))
+    for k, (col, row) in enumerate(elements):
         if row == obj_row:
             #It's an objective update
-            for scen in range(numscen):
-                prob_data['scenarios'][scen]['q'][var2Wind[col]] = data[scen]
+            blocks['q'].append((k, var2Wind[col], None))
+            base[k] = prob_data['q_root'][var2Wind[col]]
             #I am confused. The docs from haussman's website makes it clear
             #that rhs side updates should just look like a rhs data field.
             #but I keep seeing files that use RHS as the first entry as the data
             #field. I will work around it below
-        elif row=='RHS' or row in core['rhs'].keys():
+        elif col=='RHS' or col in core['rhs'].keys():
             #It's a rhs update
-            for scen in range(numscen):
-                prob_data['scenarios'][scen]['r'][row2WTind[col]] = data[scen]
-        elif row in core['ranges']:
+            blocks['r'].append((k, row2WTind[row], None))
+            base[k] = prob_data['r_root'][row2WTind[row]]
+        elif col in core['ranges']:
             print("It's a range update!")
             assert False, "Not supported yet"
         elif col in var2Wind.keys():
             #It's a W update
-            for scen in range(numscen):
-                prob_data['scenarios'][scen]['W'][row2WTind[row], var2Wind[col]]\
-                    = data[scen]
+            blocks['W'].append((k, row2WTind[row], var2Wind[col]))
+            base[k] = prob_data['W_root'][row2WTind[row], var2Wind[col]]
         elif col in var2ATind.keys():
             #It's a T update!
-            for scen in range(numscen):
-                prob_data['scenarios'][scen]['T'][row2WTind[row], var2ATind[col]]\
-                    = data[scen]
+            blocks['T'].append((k, row2WTind[row], var2ATind[col]))
+            base[k] = prob_data['T_root'][row2WTind[row], var2ATind[col]]
         else:
-            print("(row, col) is", (row, col))
+            print("(col, row) is", (col, row))
             assert False, "not a recognized update!"
+    data = np.where(modify == 'ADD', base + data,\
+        np.where(modify == 'MULTIPLY', base*data, data))
+
+    #the vectors for all scenarios are filled at once, and each
+    #scenario gets a row
+    vecs = {}
+    for block in ['q', 'r']:
+        vecs[block] = np.tile(prob_data[block + '_root'], (numscen, 1))
+        if blocks[block]:
+            ks, inds, _ = zip(*blocks[block])
+            vecs[block][:, list(inds)] = data[:, list(ks)]
+    #for the matrices the stochastic entries are added to the
+    #sparsity pattern once, so that every scenario is a copy of
+    #the pattern with its values written into the data array
+    patterns = {block:prob_data[block + '_root'] for block in ['T', 'W']}
+    mat_inds = {}
+    for block in ['T', 'W']:
+        if blocks[block]:
+            ks, rows, cols = zip(*blocks[block])
+            if scipy.sparse.issparse(patterns[block]):
+                patterns[block], data_inds = _add_to_pattern(\
+                    patterns[block], rows, cols)
+            else:
+                data_inds = (list(rows), list(cols))
+            mat_inds[block] = (list(ks), data_inds)
+    for scen in range(numscen):
+        prob_data['scenarios'][scen] = {
+            'prob':1./numscen,
+            'T': patterns['T'].copy(),
+            'W': patterns['W'].copy(),
+            'q': vecs['q'][scen],
+            'r': vecs['r'][scen]
+            }
+        for block, (ks, data_inds) in mat_inds.items():
+            mat = prob_data['scenarios'][scen][block]
+            if scipy.sparse.issparse(mat):
+                mat.data[data_inds] = data[scen, ks]
+            else:
+                mat[data_inds] = data[scen, ks]
+
+def _add_to_pattern(mat, rows, cols):
+    '''returns mat as a csr matrix with (explicit) entries at rows
+    and cols, and the positions of those entries in its data array'''
+    mat = mat.tocoo()
+    mat = scipy.sparse.coo_matrix((
+        np.concatenate([mat.data, np.zeros(len(rows))]),
+        (np.concatenate([mat.row, rows]).astype(np.intp),
+         np.concatenate([mat.col, cols]).astype(np.intp))),
+        shape=mat.shape).tocsr()
+    mat.sum_duplicates() #sorts the indices and keeps explicit zeros
+    data_inds = np.array([mat.indptr[row] + np.searchsorted(\
+        mat.indices[mat.indptr[row]:mat.indptr[row+1]], col)\
+        for row, col in zip(rows, cols)], dtype=np.intp)
+    return mat, data_inds
+
+#kept for backwards compatibility, continuous families are
+#sampled too
+generate_scenarios_from_discrete_distribs = generate_scenarios_from_distribs
+
+def scenario_realizations(prob_data):
+    '''scenario_realizations takes the output of extract_matrix_data
+    and collects the stochastic data of every scenario into a single
+    realization matrix. An entry is stochastic if it differs from the
+    root data in at least one scenario. Returns a dictionary with
+    the scenario keys, their probabilities, the stochastic entries
+    as (block, row, column) tuples, where block is one of 'q', 'r',
+    'T', 'W' and column is None for the vectors q and r, and the
+    values as a (numscen, numentries) array'''
+    scen_keys = list(prob_data['scenarios'].keys())
+    scens = [prob_data['scenarios'][scen] for scen in scen_keys]
+    probs = np.array([scen['prob'] for scen in scens], dtype=float)
+    entries = []
+    blocks = []
+    for block in ['q', 'r']:
+        root = np.asarray(prob_data[block + '_root'], dtype=float)
+        vals = np.array([scen[block] for scen in scens], dtype=float)\
+            .reshape(len(scens), root.size)
+        inds = np.flatnonzero((vals != root).any(axis=0))
+        entries += [(block, i, None) for i in inds.tolist()]
+        blocks.append(vals[:, inds])
+    for block in ['T', 'W']:
+        root = prob_data[block + '_root']
+        mats = [scen[block] for scen in scens]
+        if scipy.sparse.issparse(root):
+            lin_inds, vals = _sparse_values(root, mats)
+        else:
+            lin_inds = np.arange(np.prod(root.shape))
+            vals = np.array([np.asarray(mat) for mat in mats], dtype=float)\
+                .reshape(len(mats), -1)
+        #only keep the entries that differ from the root somewhere
+        root_vals = _values_at(root, lin_inds)
+        changed = np.flatnonzero((vals != root_vals).any(axis=0))
+        rows, cols = np.unravel_index(lin_inds[changed], root.shape)
+        entries += [(block, i, j) for i, j in zip(rows.tolist(), cols.tolist())]
+        blocks.append(vals[:, changed])
+    return {'scenarios':scen_keys, 'probs':probs, 'entries':entries,
+        'values':np.hstack(blocks)}
+
+def _sparse_values(root, mats):
+    '''values of the sparse matrices mats on the union of their
+    sparsity patterns. Returns the (row major) linear indices of the
+    pattern and a len(mats) x len(pattern) array of values. If all
+    matrices share one pattern, as the sampled scenarios do, the
+    values are their data arrays'''
+    mats = [mat.tocsr() for mat in mats]
+    if len(mats) == 0:
+        return np.empty(0, dtype=np.intp), np.empty((0, 0))
+    first = mats[0]
+    first.sum_duplicates()
+    if all((mat.indices is first.indices and mat.indptr is first.indptr)\
+      or (np.array_equal(mat.indptr, first.indptr)\
+      and np.array_equal(mat.indices, first.indices)) for mat in mats):
+        return _linear_indices(first), np.array([mat.data for mat in mats])
+    lin_inds = [_linear_indices(mat) for mat in mats]
+    pattern = np.unique(np.concatenate(lin_inds))
+    vals = np.zeros((len(mats), len(pattern)))
+    for k, (mat, inds) in enumerate(zip(mats, lin_inds)):
+        vals[k, np.searchsorted(pattern, inds)] = mat.data
+    return pattern, vals
+
+def _linear_indices(mat):
+    '''row major linear indices of the entries of a csr matrix,
+    whose duplicates are summed first'''
+    mat.sum_duplicates()
+    rows = np.repeat(np.arange(mat.shape[0]), np.diff(mat.indptr))
+    return rows*mat.shape[1] + mat.indices
+
+def _values_at(mat, lin_inds):
+    '''entries of a sparse or dense matrix at row major linear indices'''
+    rows, cols = np.unravel_index(lin_inds, mat.shape)
+    if scipy.sparse.issparse(mat):
+        return np.asarray(scipy.sparse.csr_matrix(mat)[rows, cols]).ravel()
+    return np.asarray(mat)[rows, cols]
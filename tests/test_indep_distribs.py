@@ -0,0 +1,188 @@
+import numpy as np
+import scipy.sparse
+import pytest
+from smps_reader import parse_stoch_file
+from smps_reader.two_stage_utils import generate_scenarios_from_distribs
+
+def fixed_record(name1, name2, value, period, param):
+    '''INDEP record in the fixed mps fields'''
+    return '    ' + name1.ljust(8) + '  ' + name2.ljust(8) + '  '\
+        + value.ljust(12) + '   ' + period.ljust(8) + '  ' + param + '\n'
+
+def write_stoch(tmp_path, text):
+    path = str(tmp_path / 'test.sto')
+    with open(path, 'w') as f:
+        f.write('STOCH         TEST\n' + text + 'ENDATA\n')
+    return path
+
+def test_parse_families_and_modifiers(tmp_path):
+    path = write_stoch(tmp_path, 'INDEP         DISCRETE  ADD\n'
+        + fixed_record('RHS', 'D1', '1.0', 'PER2', '0.25')
+        + fixed_record('RHS', 'D1', '3.0', 'PER2', '0.75')
+        + 'INDEP         NORMAL    MULTIPLY\n'
+        + fixed_record('X1', 'D1', '1.0', 'PER2', '0.04')
+        + fixed_record('Y1', 'D2', '0.0', 'PER2', '1.0')
+        + 'INDEP         UNIFORM\n'
+        + fixed_record('Y1', 'OBJ', '-1.0', 'PER2', '1.0')
+        + 'INDEP         GAMMA\n'
+        + fixed_record('Y2', 'D1', '2.0', 'PER2', '3.0')
+        + 'INDEP         BETA      REPLACE\n'
+        + fixed_record('Y2', 'D2', '2.0', 'PER2', '5.0')
+        + 'INDEP         LOGNORM   ADD\n'
+        + fixed_record('RHS', 'D2', '0.0', 'PER2', '0.5'))
+    stoch = parse_stoch_file(path)
+    assert stoch['discrete_flag']
+    assert stoch['distrib'] == {('RHS', 'D1'):{'values':[1., 3.],
+        'probs':[0.25, 0.75], 'modify':'ADD'}}
+    continuous = stoch['continuous']
+    assert list(continuous.keys()) == ['NORMAL', 'UNIFORM', 'GAMMA',
+        'BETA', 'LOGNORM']
+    assert continuous['NORMAL']['elements'] == [('X1', 'D1'), ('Y1', 'D2')]
+    assert np.array_equal(continuous['NORMAL']['params'],
+        [[1., 0.04], [0., 1.]])
+    assert list(continuous['NORMAL']['modify']) == ['MULTIPLY', 'MULTIPLY']
+    assert list(continuous['UNIFORM']['modify']) == ['REPLACE']
+    assert np.array_equal(continuous['GAMMA']['params'], [[2., 3.]])
+    assert np.array_equal(continuous['BETA']['params'], [[2., 5.]])
+    assert list(continuous['LOGNORM']['modify']) == ['ADD']
+
+def test_parse_without_period(tmp_path):
+    #free format without the period moves the 2nd parameter to field 5
+    path = write_stoch(tmp_path, 'INDEP DISCRETE\n'
+        + '    RHS D1 1.0 0.5\n    RHS D1 3.0 0.5\n'
+        + 'INDEP UNIFORM\n    Y1 OBJ -1.0 1.0\n')
+    stoch = parse_stoch_file(path, strict=False)
+    assert stoch['distrib'][('RHS', 'D1')]['probs'] == [0.5, 0.5]
+    assert np.array_equal(stoch['continuous']['UNIFORM']['params'],
+        [[-1., 1.]])
+
+@pytest.mark.parametrize('sections', [
+    ['INDEP DISCRETE\n    RHS D1 1.0 1.0\n'], #same discrete twice
+    ['INDEP NORMAL\n    RHS D1 0.0 1.0\n'], #discrete and continuous
+    ['INDEP NORMAL\n    Y1 D1 0.0 1.0\n    Y1 D1 0.0 1.0\n'],
+    ['INDEP NORMAL\n    Y1 D1 0.0 1.0\n', 'INDEP UNIFORM\n    Y1 D1 0.0 1.0\n'],
+    ])
+def test_parse_rejects_duplicate_elements(tmp_path, sections):
+    path = write_stoch(tmp_path, 'INDEP DISCRETE\n'
+        + '    RHS D1 1.0 0.5\n    RHS D1 3.0 0.5\n' + ''.join(sections))
+    with pytest.raises(ValueError):
+        parse_stoch_file(path, strict=False)
+
+def make_prob_data(sparse):
+    '''second stage data of a problem with first stage columns X1, X2,
+    second stage columns Y1, Y2 and second stage rows D1, D2'''
+    T = np.array([[1., 0.], [0., 2.]])
+    W = np.array([[3., 0.], [0., 4.]])
+    if sparse:
+        T, W = scipy.sparse.csr_matrix(T), scipy.sparse.csr_matrix(W)
+    return {'T_root':T, 'W_root':W, 'q_root':np.array([5., 6.]),
+        'r_root':np.array([7., 8.]), 'scenarios':{}}
+
+INDEX_DICT = {'var2ATind':{'X1':0, 'X2':1}, 'var2Wind':{'Y1':0, 'Y2':1},
+    'row2Aind':{'C1':0}, 'row2WTind':{'D1':0, 'D2':1}}
+CORE = {'rhs':{'RHS':None}, 'ranges':{}}
+
+def sample(stoch, sparse, numscen):
+    prob_data = make_prob_data(sparse)
+    generate_scenarios_from_distribs(stoch, prob_data, 'OBJ', INDEX_DICT,
+        CORE, numscen, rng=0)
+    return prob_data
+
+def dense(mat):
+    return mat.toarray() if scipy.sparse.issparse(mat) else np.asarray(mat)
+
+def discrete(values, probs, modify='REPLACE'):
+    return {'values':np.array(values), 'probs':np.array(probs),
+        'modify':modify}
+
+def family(elements, params, modify):
+    return {'elements':elements, 'params':np.array(params, dtype=float),
+        'modify':np.array(modify)}
+
+@pytest.mark.parametrize('sparse', [True, False])
+def test_updates_go_to_the_right_element(sparse):
+    #INDEP elements are (column, row), objective, T and W updates
+    #used to be looked up with the two swapped
+    stoch = {'distrib':{('Y2', 'OBJ'):discrete([10.], [1.]),
+        ('RHS', 'D2'):discrete([11.], [1.]),
+        ('Y1', 'D2'):discrete([12.], [1.]),
+        ('X2', 'D1'):discrete([13.], [1.])}, 'continuous':{}}
+    prob_data = sample(stoch, sparse, 3)
+    for scen in prob_data['scenarios'].values():
+        assert np.array_equal(scen['q'], [5., 10.])
+        assert np.array_equal(scen['r'], [7., 11.])
+        assert np.array_equal(dense(scen['W']), [[3., 0.], [12., 4.]])
+        assert np.array_equal(dense(scen['T']), [[1., 13.], [0., 2.]])
+    #the root is left alone
+    assert np.array_equal(dense(prob_data['T_root']), [[1., 0.], [0., 2.]])
+
+@pytest.mark.parametrize('sparse', [True, False])
+def test_sample_moments_and_modifiers(sparse):
+    stoch = {'distrib':{('RHS', 'D1'):discrete([1., 3.], [0.25, 0.75], 'ADD')},
+        'continuous':{
+            'NORMAL':family([('Y1', 'D1'), ('RHS', 'D2')],
+                [[0., 4.], [2., 0.25]], ['ADD', 'MULTIPLY']),
+            'UNIFORM':family([('Y1', 'OBJ')], [[1., 3.]], ['REPLACE']),
+            'GAMMA':family([('X1', 'D1')], [[2., 3.]], ['REPLACE']),
+            'BETA':family([('Y2', 'D2')], [[2., 6.]], ['REPLACE']),
+            'LOGNORM':family([('X2', 'D2')], [[0., 0.25]], ['MULTIPLY'])}}
+    numscen = 20000
+    prob_data = sample(stoch, sparse, numscen)
+    scens = list(prob_data['scenarios'].values())
+    assert np.isclose(sum(scen['prob'] for scen in scens), 1.)
+    r = np.array([scen['r'] for scen in scens])
+    q = np.array([scen['q'] for scen in scens])
+    W = np.array([dense(scen['W']) for scen in scens])
+    T = np.array([dense(scen['T']) for scen in scens])
+    #7 + 1 or 7 + 3
+    assert set(np.unique(r[:, 0])) == {8., 10.}
+    assert abs(np.mean(r[:, 0] == 10.) - 0.75) < 0.02
+    #8 * N(2, 0.25)
+    assert abs(r[:, 1].mean() - 16.) < 0.05
+    assert abs(r[:, 1].std() - 4.) < 0.1
+    #3 + N(0, 4)
+    assert abs(W[:, 0, 0].mean() - 3.) < 0.05
+    assert abs(W[:, 0, 0].std() - 2.) < 0.05
+    #U(1, 3)
+    assert q[:, 0].min() >= 1. and q[:, 0].max() <= 3.
+    assert abs(q[:, 0].mean() - 2.) < 0.02
+    assert np.all(q[:, 1] == 6.)
+    #gamma with scale 2 and shape 3
+    assert abs(T[:, 0, 0].mean() - 6.) < 0.1
+    #beta(2, 6)
+    assert abs(W[:, 1, 1].mean() - 0.25) < 0.01
+    #2 * lognormal(0, 0.25), median 2
+    assert abs(np.median(T[:, 1, 1]) - 2.) < 0.05
+    assert np.all(T[:, 1, 1] > 0.)
+
+def test_sparse_and_dense_agree():
+    stoch = {'distrib':{('RHS', 'D1'):discrete([1., 3.], [0.5, 0.5])},
+        'continuous':{'NORMAL':family([('Y1', 'D2'), ('X1', 'D1')],
+            [[0., 1.], [1., 1.]], ['ADD', 'MULTIPLY'])}}
+    sparse_data = sample(stoch, True, 50)
+    dense_data = sample(stoch, False, 50)
+    for scen in range(50):
+        for block in ['T', 'W']:
+            assert np.allclose(dense(sparse_data['scenarios'][scen][block]),
+                dense_data['scenarios'][scen][block])
+        assert np.array_equal(sparse_data['scenarios'][scen]['r'],
+            dense_data['scenarios'][scen]['r'])
+
+def test_discrete_probabilities_must_sum_to_one():
+    stoch = {'distrib':{('RHS', 'D1'):discrete([1., 3.], [0.25, 0.5])},
+        'continuous':{}}
+    with pytest.raises(AssertionError):
+        sample(stoch, True, 10)
+
+def test_global_seed_without_rng():
+    stoch = {'distrib':{}, 'continuous':{
+        'NORMAL':family([('RHS', 'D1')], [[0., 1.]], ['REPLACE'])}}
+    def draw():
+        prob_data = make_prob_data(True)
+        generate_scenarios_from_distribs(stoch, prob_data, 'OBJ',
+            INDEX_DICT, CORE, 5)
+        return [scen['r'][0] for scen in prob_data['scenarios'].values()]
+    np.random.seed(0)
+    first = draw()
+    np.random.seed(0)
+    assert draw() == first
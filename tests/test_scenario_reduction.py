@@ -0,0 +1,85 @@
+import numpy as np
+import pytest
+from smps_reader.scenario_reduction import select_scenarios
+
+def brute_force_forward(values, probs, numscen):
+    '''forward selection with the full distance matrix'''
+    dist = np.linalg.norm(values[:, None] - values[None], axis=2)
+    selected = []
+    for _ in range(numscen):
+        cands = [u for u in range(len(values)) if u not in selected]
+        costs = [probs @ dist[:, selected + [u]].min(axis=1) for u in cands]
+        selected.append(cands[int(np.argmin(costs))])
+    return selected
+
+def brute_force_backward(values, probs, numscen):
+    '''backward reduction with the full distance matrix'''
+    dist = np.linalg.norm(values[:, None] - values[None], axis=2)
+    np.fill_diagonal(dist, np.inf)
+    probs = probs.copy()
+    kept = list(range(len(values)))
+    while len(kept) > numscen:
+        sub = dist[np.ix_(kept, kept)]
+        deleted = int(np.argmin(probs[kept]*sub.min(axis=1)))
+        probs[kept[int(np.argmin(sub[deleted]))]] += probs[kept[deleted]]
+        kept.pop(deleted)
+    return kept
+
+def brute_force_probs(values, probs, selected):
+    '''probability of every scenario moved to the closest selected one'''
+    dist = np.linalg.norm(values[:, None] - values[None, selected], axis=2)
+    return np.bincount(np.argmin(dist, axis=1), weights=probs,
+        minlength=len(selected))
+
+@pytest.fixture
+def scenarios():
+    rng = np.random.default_rng(0)
+    values = rng.normal(size=(40, 3))
+    probs = rng.random(40)
+    return values, probs/probs.sum()
+
+@pytest.mark.parametrize('numscen', [1, 3, 15, 16, 39])
+def test_forward_selection(scenarios, numscen):
+    values, probs = scenarios
+    inds, new_probs = select_scenarios(values, probs, numscen, method='forward')
+    assert list(inds) == brute_force_forward(values, probs, numscen)
+    assert np.allclose(new_probs, brute_force_probs(values, probs, inds))
+    assert np.isclose(new_probs.sum(), probs.sum())
+
+@pytest.mark.parametrize('numscen', [1, 3, 15, 16, 39])
+def test_backward_reduction(scenarios, numscen):
+    values, probs = scenarios
+    inds, new_probs = select_scenarios(values, probs, numscen, method='backward')
+    assert list(inds) == brute_force_backward(values, probs, numscen)
+    assert np.allclose(new_probs, brute_force_probs(values, probs, inds))
+    assert np.isclose(new_probs.sum(), probs.sum())
+
+@pytest.mark.parametrize('numscen', [1, 3, 5])
+def test_backward_reduction_to_few_scenarios(numscen):
+    #has to search for new neighbors once fewer than the
+    #cached number of them are left
+    rng = np.random.default_rng(1)
+    values = rng.normal(size=(200, 3))
+    probs = rng.random(200)
+    probs /= probs.sum()
+    inds, new_probs = select_scenarios(values, probs, numscen, method='backward')
+    assert list(inds) == brute_force_backward(values, probs, numscen)
+    assert np.isclose(new_probs.sum(), 1.)
+    #equal probabilities give ties, so only check it runs
+    inds, new_probs = select_scenarios(values, np.full(200, 1/200), numscen,
+        method='backward')
+    assert len(inds) == numscen
+    assert np.isclose(new_probs.sum(), 1.)
+
+def test_infeasible_forward_selection():
+    values = np.zeros((100000, 1))
+    probs = np.full(100000, 1e-5)
+    with pytest.raises(ValueError):
+        select_scenarios(values, probs, 300, method='forward')
+
+def test_small_blocks(scenarios):
+    values, probs = scenarios
+    for method in ['forward', 'backward']:
+        assert np.array_equal(
+            select_scenarios(values, probs, 5, method=method)[0],
+            select_scenarios(values, probs, 5, method=method, max_block=7)[0])
@@ -0,0 +1,104 @@
+import numpy as np
+import scipy.sparse
+import pytest
+from smps_reader import parse_stoch_file, parse_time_file
+from smps_reader.smps_writer import write, write_time_file
+
+def make_prob_data(numscen=5):
+    '''two stage problem with stochastic q, r and T entries. T[1, 1]
+    is zero in the core and column Y3 has no entries'''
+    T = scipy.sparse.csr_matrix(np.array([[1., 0.], [0., 0.]]))
+    W = scipy.sparse.csr_matrix(np.array([[1., 2., 0.], [0., 1., 0.]]))
+    prob_data = {'A':scipy.sparse.csr_matrix(np.array([[1., 1.]])),
+        'b':np.array([4.]), 'c':np.array([1., 2.]),
+        'l1':np.array([0., -np.inf]), 'u1':np.array([np.inf, np.inf]),
+        'l2':np.array([1., 0., -2.]), 'u2':np.array([1., 5., np.inf]),
+        'T_root':T, 'W_root':W, 'r_root':np.array([3., 0.]),
+        'q_root':np.array([1., 1., 0.]),
+        'ineq_b':np.array([True]), 'ineq_r':np.array([False, True]),
+        'prob_name':'TESTPROB', 'periods':['PER1', 'PER2'], 'obj_row':'OBJ',
+        'index_dict':{'var2ATind':{'X1':0, 'X2':1},
+            'var2Wind':{'Y1':0, 'Y2':1, 'Y3':2}, 'row2Aind':{'C1':0},
+            'row2WTind':{'D1':0, 'D2':1}},
+        'scenarios':{}}
+    for scen in range(numscen):
+        T_scen = T.tolil()
+        T_scen[1, 1] = scen + 1.
+        q = prob_data['q_root'].copy()
+        q[0] = 0.5*scen
+        r = prob_data['r_root'].copy()
+        r[1] = 2.*scen
+        prob_data['scenarios'][scen] = {'prob':1./numscen,
+            'T':T_scen.tocsr(), 'W':W.copy(), 'q':q, 'r':r}
+    return prob_data
+
+def read_records(path, section):
+    '''(field 2, field 3) -> value for the records of a core file section'''
+    records = {}
+    in_section = False
+    with open(path) as f:
+        for line in f:
+            if line[0] != ' ':
+                in_section = line.split()[0] == section
+            elif in_section:
+                fields = line.split()
+                records[tuple(fields[-3:-1])] = float(fields[-1])
+    return records
+
+@pytest.mark.parametrize('strict', [True, False])
+def test_round_trip(tmp_path, strict):
+    prob_data = make_prob_data()
+    path = str(tmp_path / 'prob.sto')
+    write(path, prob_data, strict=strict, chunk_size=2)
+
+    time_dict = parse_time_file(str(tmp_path / 'prob.tim'), strict=strict)
+    assert time_dict['format'] == 'implicit'
+    assert time_dict['periods'] == {
+        'PER1':{'row_start':'C1', 'col_start':'X1'},
+        'PER2':{'row_start':'D1', 'col_start':'Y1'}}
+
+    stoch = parse_stoch_file(path, strict=strict)
+    assert stoch['scenarios_flag']
+    assert list(stoch['scenarios'].keys()) == ['S0', 'S1', 'S2', 'S3', 'S4']
+    for scen in range(5):
+        record = stoch['scenarios']['S' + str(scen)]
+        assert record['parent'] == "'ROOT'"
+        assert record['period'] == 'PER2'
+        assert np.isclose(record['prob'], 0.2)
+        assert sorted(record['data']) == sorted([
+            ('', 'Y1', 'OBJ', 0.5*scen), ('', 'RHS', 'D2', 2.*scen),
+            ('', 'X2', 'D2', scen + 1.)])
+
+    columns = read_records(str(tmp_path / 'prob.cor'), 'COLUMNS')
+    assert columns[('X1', 'D1')] == 1.
+    assert columns[('X2', 'D2')] == 0. #stochastic placeholder
+    assert columns[('Y3', 'OBJ')] == 0. #empty column
+    assert ('Y1', 'D2') not in columns
+    rhs = read_records(str(tmp_path / 'prob.cor'), 'RHS')
+    assert rhs == {('RHS', 'C1'):4., ('RHS', 'D1'):3., ('RHS', 'D2'):0.}
+    with open(str(tmp_path / 'prob.cor')) as f:
+        bounds = sorted(tuple(line.split()[:3]) for line in
+            f.read().split('BOUNDS\n')[1].splitlines()[:-1])
+    assert bounds == [('FR', 'BND', 'X2'), ('FX', 'BND', 'Y1'),
+        ('LO', 'BND', 'Y3'), ('UP', 'BND', 'Y2')]
+
+def test_strict_rejects_long_names(tmp_path):
+    prob_data = make_prob_data()
+    prob_data['scenarios']['SCENARIO_LONG'] = prob_data['scenarios'].pop(0)
+    with pytest.raises(ValueError):
+        write(str(tmp_path / 'prob.sto'), prob_data)
+    write(str(tmp_path / 'prob.sto'), prob_data, strict=False)
+    stoch = parse_stoch_file(str(tmp_path / 'prob.sto'), strict=False)
+    assert 'SCENARIO_LONG' in stoch['scenarios']
+
+def test_strict_rejects_long_values(tmp_path):
+    prob_data = make_prob_data()
+    prob_data['scenarios'][0]['r'][1] = -1.234567e200
+    with pytest.raises(ValueError):
+        write(str(tmp_path / 'prob.sto'), prob_data)
+
+def test_time_file_needs_both_periods(tmp_path):
+    prob_data = make_prob_data()
+    prob_data['index_dict']['row2WTind'] = {}
+    with pytest.raises(ValueError):
+        write_time_file(str(tmp_path / 'prob.tim'), prob_data)